@@ -0,0 +1,172 @@
+# Kommandozeilen-Stapelverarbeitung für Texturanimationen, ohne QApplication
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from texture_animation import (EXPORT_FORMATS, TextureIndex, extract_texture_paths,
+                               normalize_animation, find_missing_textures, dump_yaml,
+                               export_animation, keyframe_durations, frame_durations_ms,
+                               write_file_atomic, load_yaml)
+
+YAML_EXTENSIONS = ('.yaml', '.yml')
+PREVIEW_EXTENSIONS = {'gif': '.gif', 'apng': '.png', 'webp': '.webp', 'spritesheet': '.png'}
+
+# Ein Index pro Worker-Prozess: jeder Texturordner wird dort nur einmal eingelesen
+texture_index = TextureIndex()
+
+
+def find_yaml_files(root):
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(YAML_EXTENSIONS):
+                yield os.path.join(directory, name)
+
+
+def process_file(file_path, options):
+    # Läuft in einem Worker-Prozess und liefert einen Berichtseintrag
+    result = {'file': file_path, 'frames': 0}
+    try:
+        yaml_directory = os.path.dirname(os.path.abspath(file_path))
+        with open(file_path, 'r', encoding='utf-8') as file:
+            yaml_content = file.read()
+        data = load_yaml(yaml_content)
+        _, animation_frames = extract_texture_paths(data)
+        result['frames'] = len(animation_frames)
+        if not animation_frames:
+            return result
+
+        if options['check']:
+            result['missing'] = find_missing_textures(animation_frames, yaml_directory, texture_index)
+
+        if options['normalize']:
+            frame_count = data.get('FrameCount') if isinstance(data, dict) else None
+            changed = normalize_animation(data, animation_frames, file_path)
+            result['frame_count'] = {'before': frame_count,
+                                     'after': data.get('FrameCount') if isinstance(data, dict) else None}
+            result['normalized'] = changed
+            if changed and options['fix']:
+                # Atomar, damit ein abgebrochener Lauf keine halb geschriebenen Dateien hinterlässt
+                write_file_atomic(file_path, dump_yaml(data))
+
+        if options['preview']:
+            export_format = options['preview']
+            # Die Vorschau übernimmt das Timing der KeyFrames, fehlende Texturen fallen heraus
+            durations = frame_durations_ms(keyframe_durations(data, len(animation_frames)), options['fps'])
+            texture_files = []
+            frame_durations = []
+            for texture_path, duration in zip(animation_frames, durations):
+                resolved = texture_index.resolve(os.path.join(yaml_directory, texture_path))
+                if resolved is not None:
+                    texture_files.append(resolved[0])
+                    frame_durations.append(duration)
+            if texture_files:
+                relative = os.path.relpath(file_path, options['root'])
+                preview_path = os.path.join(options['preview_dir'],
+                                            os.path.splitext(relative)[0] + PREVIEW_EXTENSIONS[export_format])
+                os.makedirs(os.path.dirname(preview_path), exist_ok=True)
+                # Bereits im Worker-Prozess, daher kein weiterer Pool
+                export_animation(texture_files, preview_path, export_format,
+                                 frame_duration=frame_durations, workers=1)
+                result['preview'] = preview_path
+
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def process_file_batch(file_paths, options):
+    return [process_file(file_path, options) for file_path in file_paths]
+
+
+def run_batch(root, options, jobs=None, chunk_size=32, progress=None):
+    files = list(find_yaml_files(root))
+    jobs = jobs or os.cpu_count() or 1
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    results = []
+    if jobs <= 1:
+        for chunk in chunks:
+            results.extend(process_file_batch(chunk, options))
+            if progress:
+                progress(len(results), len(files))
+        return results
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+        for chunk_results in pool.map(process_file_batch, chunks, [options] * len(chunks)):
+            results.extend(chunk_results)
+            if progress:
+                progress(len(results), len(files))
+    return results
+
+
+def build_report(results, elapsed):
+    animations = [r for r in results if r['frames']]
+    return {
+        'summary': {
+            'files': len(results),
+            'animations': len(animations),
+            'frames': sum(r['frames'] for r in results),
+            'missing_textures': sum(len(r.get('missing', [])) for r in results),
+            'files_with_missing_textures': sum(1 for r in results if r.get('missing')),
+            'normalized': sum(1 for r in results if r.get('normalized')),
+            'previews': sum(1 for r in results if r.get('preview')),
+            'errors': sum(1 for r in results if r.get('error')),
+            'seconds': round(elapsed, 3),
+        },
+        'files': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate, normalize and export texture animation YAML files.")
+    parser.add_argument('root', help="directory that is searched recursively for *.yaml / *.yml files")
+    parser.add_argument('--check', action='store_true', help="check that all referenced textures exist")
+    parser.add_argument('--normalize', action='store_true', help="check FrameCount against the keyframe timeline")
+    parser.add_argument('--fix', action='store_true', help="write normalized files back to disk")
+    parser.add_argument('--preview', choices=sorted(EXPORT_FORMATS), help="export a preview animation per file")
+    parser.add_argument('--preview-dir', default='previews', help="output directory for previews")
+    parser.add_argument('--fps', type=int, default=30, help="playback speed of the previews")
+    parser.add_argument('--report', default='-', help="JSON report path, '-' for stdout")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=32, help="files per worker task")
+    args = parser.parse_args(argv)
+
+    if not (args.check or args.normalize or args.preview):
+        args.check = True
+
+    options = {
+        'root': os.path.abspath(args.root),
+        'check': args.check,
+        'normalize': args.normalize or args.fix,
+        'fix': args.fix,
+        'preview': args.preview,
+        'preview_dir': os.path.abspath(args.preview_dir),
+        'fps': max(1, args.fps),
+    }
+
+    def progress(done, total):
+        print(f"\r{done}/{total} files", end='', file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    results = run_batch(options['root'], options, args.jobs, args.chunk_size, progress)
+    print(file=sys.stderr)
+    report = build_report(results, time.perf_counter() - start)
+
+    if args.report == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+    summary = report['summary']
+    return 1 if summary['errors'] or summary['missing_textures'] else 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
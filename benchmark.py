@@ -0,0 +1,357 @@
+# Headless-Benchmark für den Editor: erzeugt synthetische Animationen und misst die heißen Pfade
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+import importlib.util
+from importlib.machinery import SourceFileLoader
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+GUI_SOURCE = os.path.join(ROOT, "Neo Bowser City TV.PY")
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+PAINT_ZOOM_LEVELS = [1.0, 4.0, 16.0]
+
+
+def make_textures(directory, count, size):
+    # Verschiedenfarbige Texturen mit Transparenz, damit Export und Palette echte Arbeit haben
+    from PIL import Image, ImageDraw
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(count * 7919 + size)
+    names = []
+    for i in range(count):
+        image = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        for _ in range(8):
+            x0, y0 = rng.randrange(size), rng.randrange(size)
+            x1, y1 = rng.randrange(x0, size + 1), rng.randrange(y0, size + 1)
+            draw.rectangle((x0, y0, x1, y1), fill=(rng.randrange(256), rng.randrange(256),
+                                                   rng.randrange(256), rng.choice((128, 255))))
+        name = f"tex_{i:05d}"
+        image.save(os.path.join(directory, name + ".png"))
+        names.append(name)
+    return names
+
+
+def make_animation(file_path, frame_total, texture_names, key_step=1):
+    from texture_animation import dump_yaml
+    key_frames = {i * key_step: f"textures/{texture_names[i % len(texture_names)]}" for i in range(frame_total)}
+    data = {
+        'Name': os.path.splitext(os.path.basename(file_path))[0],
+        'Path': None,
+        'Loop': True,
+        'FrameCount': frame_total * key_step,
+        'MaterialAnimConfigs': [{
+            'Name': 'benchmark_material',
+            'TexturePatternInfos': [{
+                'Name': '_a0',
+                'IsConstant': False,
+                'ConstantValue': None,
+                'CurveData': {'KeyFrames': key_frames},
+            }],
+            'ParamInfos': [],
+        }],
+    }
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write(dump_yaml(data))
+
+
+def reset_peak_rss():
+    # Linux kann den Höchststand des Arbeitsspeichers pro Phase zurücksetzen
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def measure(func, min_seconds=0.2, max_repeat=20):
+    # Wiederholt kurze Messungen, bis genug Zeit vergangen ist; liefert (bester, Median) in ms
+    times = []
+    started = time.perf_counter()
+    while len(times) < max_repeat and (not times or time.perf_counter() - started < min_seconds):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return round(times[0] * 1000, 3), round(times[len(times) // 2] * 1000, 3)
+
+
+class Benchmark:
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.texture_dir = os.path.join(workdir, "textures")
+        self.texture_names = make_textures(self.texture_dir, args.texture_count, args.texture_size)
+
+        from PySide6.QtWidgets import QApplication
+        from PySide6.QtCore import QSettings
+        self.app = QApplication.instance() or QApplication(sys.argv[:1])
+        self.gui = load_gui_module()
+        self.QSettings = QSettings
+
+    def run_event_loop(self, seconds=None, condition=None, timeout=60.0):
+        # Läuft in der Qt-Ereignisschleife, bis die Zeit um oder die Bedingung erfüllt ist
+        from PySide6.QtCore import QEventLoop, QTimer
+        loop = QEventLoop()
+        deadline = time.perf_counter() + (seconds if seconds is not None else timeout)
+
+        def check():
+            if time.perf_counter() >= deadline or (condition is not None and condition()):
+                loop.quit()
+
+        poll = QTimer()
+        poll.setInterval(1)
+        poll.timeout.connect(check)
+        poll.start()
+        loop.exec()
+        poll.stop()
+        if condition is not None and not condition():
+            raise TimeoutError("benchmark step did not finish in time")
+
+    def phase(self, results, name, func):
+        reset_peak_rss()
+        start = time.perf_counter()
+        values = func() or {}
+        values.setdefault('seconds', round(time.perf_counter() - start, 4))
+        values['peak_rss_mb'] = peak_rss_mb()
+        results[name] = values
+        print(f"  {name:<18} {values['seconds']:>9.3f} s  "
+              + "  ".join(f"{key}={value}" for key, value in values.items()
+                          if key not in ('seconds', 'peak_rss_mb')),
+              file=sys.stderr)
+
+    def new_window(self, cache_dir):
+        window = self.gui.MainWindow()
+        # Keine Einträge in den echten Einstellungen und Caches des Benutzers
+        window.settings = self.QSettings(os.path.join(self.workdir, "settings.ini"), self.QSettings.IniFormat)
+        window.parse_cache_dir = os.path.join(cache_dir, "parsed")
+        window.thumbnail_provider.cache_dir = os.path.join(cache_dir, "thumbnails")
+        window.document_saver.timer.setInterval(60 * 60 * 1000)
+        window.resize(1200, 800)
+        window.show()
+        return window
+
+    def open_file(self, window, file_path):
+        window.load_yaml_file(file_path)
+        self.run_event_loop(condition=lambda: window.load_thread is None and window.current_file == file_path,
+                            timeout=self.args.timeout)
+
+    def run_size(self, frame_total):
+        from texture_animation import load_animation_file, export_animation, reset_timing_stats, timing_stats
+        print(f"{frame_total} frames", file=sys.stderr)
+        size_dir = os.path.join(self.workdir, f"frames_{frame_total}")
+        os.makedirs(size_dir, exist_ok=True)
+        file_path = os.path.join(self.workdir, f"animation_{frame_total}.yaml")
+        make_animation(file_path, frame_total, self.texture_names, self.args.key_step)
+
+        reset_timing_stats()
+        results = {}
+        window = self.new_window(size_dir)
+        try:
+            # Lesen und Parsen wie beim Öffnen in der Anwendung, ohne Parse-Cache
+            self.phase(results, 'load_file', lambda: dict(zip(
+                ('best_ms', 'median_ms'), measure(lambda: load_animation_file(file_path)))))
+
+            # Erstes Öffnen ohne, zweites mit Parse-Cache
+            self.phase(results, 'open_cold', lambda: self.open_file(window, file_path))
+            self.phase(results, 'open_warm', lambda: self.open_file(window, file_path))
+
+            self.phase(results, 'load_textures', lambda: dict(zip(
+                ('best_ms', 'median_ms'), measure(window.load_textures))))
+
+            def reorder():
+                rng = random.Random(frame_total)
+                count = min(self.args.reorders, frame_total)
+                start = time.perf_counter()
+                for _ in range(count):
+                    window.reorder_animation_frames(rng.randrange(frame_total), rng.randrange(frame_total))
+                elapsed = time.perf_counter() - start
+                return {'operations': count, 'mean_ms': round(elapsed / max(1, count) * 1000, 4)}
+            self.phase(results, 'reorder', reorder)
+
+            def playback():
+                window.stop_animation()
+                window.fps_input.setValue(self.args.fps)
+                window.loops_checkbox.setChecked(True)
+                window.toggle_animation()
+                start = time.perf_counter()
+                self.run_event_loop(self.args.playback_seconds)
+                elapsed = time.perf_counter() - start
+                stats = window.playback_stats
+                achieved, due = stats.rates(time.perf_counter())
+                window.pause_animation()
+                # Tatsächlich gezeigte Frames; der Abspielkopf selbst läuft auch ohne Anzeige mit der Uhr weiter
+                presented = stats.presented_total
+                return {'target_fps': self.args.fps, 'presented': presented,
+                        'presented_fps': round(presented / elapsed, 2), 'dropped': stats.dropped,
+                        'dropped_percent': round(stats.dropped / max(1, presented + stats.dropped) * 100, 2),
+                        'window_fps': round(achieved, 2), 'due_fps': round(due, 2),
+                        'decode_misses': stats.decode_misses}
+            self.phase(results, 'playback', playback)
+
+            def paint():
+                widget = window.checkered_widget
+                widget.reset_view()
+                values = {}
+                for zoom_level in PAINT_ZOOM_LEVELS:
+                    widget.zoom_level = zoom_level
+                    widget.repaint()  # Skalierte Pixmap einmal erzeugen
+                    start = time.perf_counter()
+                    for _ in range(self.args.paints):
+                        widget.repaint()
+                    values[f"zoom_{zoom_level:g}_ms"] = round(
+                        (time.perf_counter() - start) / self.args.paints * 1000, 4)
+                widget.reset_view()
+                return values
+            self.phase(results, 'paint', paint)
+        finally:
+            window.document_saver.flush()
+            window.close()
+            window.deleteLater()
+            self.run_event_loop(0.05)
+
+        texture_files = [os.path.join(self.texture_dir, self.texture_names[i % len(self.texture_names)] + ".png")
+                         for i in range(frame_total)]
+        for export_format in self.args.export_formats:
+            extension = '.png' if export_format in ('apng', 'spritesheet') else f".{export_format}"
+            output = os.path.join(size_dir, f"export_{export_format}{extension}")
+
+            def export():
+                export_animation(texture_files, output, export_format, frame_duration=33, workers=self.args.jobs)
+                return {'megabytes': round(os.path.getsize(output) / (1024 * 1024), 3)}
+            self.phase(results, f"export_{export_format}", export)
+
+        return {'frames': frame_total, 'phases': results, 'hot_paths': timing_stats()}
+
+
+def load_gui_module():
+    # Der Dateiname der Anwendung enthält Leerzeichen, daher kein normaler Import
+    loader = SourceFileLoader('neo_bowser_city_tv', GUI_SOURCE)
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[loader.name] = module
+    loader.exec_module(module)
+    return module
+
+
+def compare(report, baseline, tolerance):
+    # Verglichen werden die Kennzahlen pro Operation (*_ms, kleiner ist besser), ohne solche die
+    # Gesamtdauer; bei der Wiedergabe die gezeigten Frames pro Sekunde und der Anteil übersprungener Frames
+    previous = {(entry['frames'], name): phase
+                for entry in baseline.get('results', []) for name, phase in entry['phases'].items()}
+    regressions = []
+    for entry in report['results']:
+        for name, phase in entry['phases'].items():
+            before = previous.get((entry['frames'], name))
+            if not before:
+                continue
+            label = f"{entry['frames']} frames / {name}"
+            metrics = [key for key in phase if key.endswith('_ms') and key in before]
+            if not metrics and 'presented_fps' not in phase and 'seconds' in before:
+                metrics = ['seconds']
+            for key in metrics:
+                old, new = before[key], phase[key]
+                if key == 'seconds':
+                    old, new = old * 1000, new * 1000
+                if new > old * (1 + tolerance) and new - old > 0.05:
+                    regressions.append(f"{label} {key}: {before[key]} -> {phase[key]}")
+            if 'presented_fps' in phase and 'presented_fps' in before:
+                if phase['presented_fps'] < before['presented_fps'] * (1 - tolerance):
+                    regressions.append(f"{label} presented_fps: {before['presented_fps']} -> {phase['presented_fps']}")
+            if 'dropped_percent' in phase and 'dropped_percent' in before:
+                old, new = before['dropped_percent'], phase['dropped_percent']
+                if new > old * (1 + tolerance) and new - old > 1.0:
+                    regressions.append(f"{label} dropped_percent: {old} -> {new}")
+    return regressions
+
+
+def main(argv=None):
+    from texture_animation import EXPORT_FORMATS
+    parser = argparse.ArgumentParser(description="Headless benchmark of the texture animation editor.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="frame counts to benchmark")
+    parser.add_argument('--texture-count', type=int, default=64, help="distinct textures the frames cycle through")
+    parser.add_argument('--texture-size', type=int, default=64, help="edge length of the textures in pixels")
+    parser.add_argument('--key-step', type=int, default=1, help="distance between KeyFrames")
+    parser.add_argument('--reorders', type=int, default=200, help="reorder operations per size")
+    parser.add_argument('--fps', type=int, default=120, help="playback speed")
+    parser.add_argument('--playback-seconds', type=float, default=3.0, help="duration of sustained playback")
+    parser.add_argument('--paints', type=int, default=200, help="repaints per zoom level")
+    parser.add_argument('--export-formats', nargs='*', choices=sorted(EXPORT_FORMATS), default=sorted(EXPORT_FORMATS),
+                        help="formats passed to export_animation (none to skip)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="export worker processes")
+    parser.add_argument('--timeout', type=float, default=300.0, help="seconds to wait for a file to open")
+    parser.add_argument('--output', default='benchmark_report.json', help="JSON report path, '-' for stdout")
+    parser.add_argument('--baseline', help="earlier report; slower phases are listed and the exit code is 1")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown against the baseline")
+    parser.add_argument('--keep', action='store_true', help="keep the generated files")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='nbc-benchmark-')
+    try:
+        benchmark = Benchmark(args, workdir)
+        results = [benchmark.run_size(frame_total) for frame_total in args.sizes]
+    finally:
+        if args.keep:
+            print(f"generated files: {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    from PySide6 import __version__ as pyside_version
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'pyside': pyside_version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'qpa_platform': os.environ.get('QT_QPA_PLATFORM'),
+        },
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'results': results,
+    }
+
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for line in regressions:
+            print(f"slower: {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    # Headless und mit eingeschalteter Zeitmessung (Tabelle am Ende auf stderr),
+    # beides muss vor dem ersten Import von texture_animation feststehen
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    os.environ.setdefault('NBC_PROFILE', '-')
+    sys.exit(main())
@@ -4,5 +4,6 @@ setup(
     name="Neo Bowser City TV",
     version="1.0",
     description="Ein cooles Programm",
-    executables=[Executable("Neo Bowser City TV.py")]# icon="Data/icons/icon.ico"
+    executables=[Executable("Neo Bowser City TV.py"),# icon="Data/icons/icon.ico"
+                 Executable("batch_process.py", target_name="nbc-batch")]
 )
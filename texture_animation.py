@@ -0,0 +1,935 @@
+# Qt-freie Kernfunktionen für Texturanimationen (YAML, Export, Pfadauflösung)
+import os
+import io
+import sys
+import json
+import shutil
+import math
+import struct
+import zlib
+import hashlib
+import pickle
+import tempfile
+import threading
+import atexit
+import functools
+import multiprocessing
+import time
+from bisect import bisect_right
+from collections import deque
+from itertools import accumulate, repeat
+from concurrent.futures import ProcessPoolExecutor
+import yaml
+from PIL import Image, GifImagePlugin
+
+TEXTURE_EXTENSIONS = ['', '.png', '.jpg', '.jpeg']
+
+EXPORT_FORMATS = {
+    'gif': "GIF Files (*.gif)",
+    'apng': "Animated PNG Files (*.png *.apng)",
+    'webp': "Animated WebP Files (*.webp)",
+    'spritesheet': "Sprite Sheet (*.png)",
+}
+
+# Ab dieser Frameanzahl lohnt sich der Start eines Prozesspools
+PARALLEL_MIN_FRAMES = 16
+GIF_TRANSPARENT_INDEX = 255
+GLOBAL_PALETTE_SAMPLES = 16
+
+# libyaml ist deutlich schneller, falls PyYAML damit gebaut wurde
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+# Opt-in-Zeitmessung der heißen Pfade: NBC_PROFILE=- gibt beim Beenden eine Tabelle auf stderr aus,
+# NBC_PROFILE=<datei.json> schreibt die Werte als JSON. Ohne die Variable bleibt @timed wirkungslos.
+PROFILE_ENV = 'NBC_PROFILE'
+PROFILE_TARGET = os.environ.get(PROFILE_ENV, '')
+call_timings = {}  # Name -> Liste der Aufrufdauern in Sekunden
+
+
+def timed(name=None):
+    # Dekorator für heiße Pfade; ist die Messung aus, wird die Funktion unverändert zurückgegeben
+    def decorate(func):
+        if not PROFILE_TARGET:
+            return func
+        samples = call_timings.setdefault(name or func.__qualname__, [])
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def timing_stats():
+    # Kennzahlen pro gemessener Funktion in Millisekunden
+    stats = {}
+    for name, samples in call_timings.items():
+        if not samples:
+            continue
+        ordered = sorted(samples)
+        stats[name] = {
+            'calls': len(ordered),
+            'total_ms': round(sum(ordered) * 1000, 3),
+            'mean_ms': round(sum(ordered) / len(ordered) * 1000, 4),
+            'median_ms': round(ordered[len(ordered) // 2] * 1000, 4),
+            'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+            'max_ms': round(ordered[-1] * 1000, 4),
+        }
+    return stats
+
+
+def reset_timing_stats():
+    for samples in call_timings.values():
+        samples.clear()
+
+
+def dump_timing_stats(target=None):
+    target = target or PROFILE_TARGET
+    stats = timing_stats()
+    if target == '-':
+        print(f"{'function':<40} {'calls':>8} {'total ms':>12} {'mean ms':>10} {'p95 ms':>10} {'max ms':>10}",
+              file=sys.stderr)
+        for name, row in sorted(stats.items(), key=lambda item: -item[1]['total_ms']):
+            print(f"{name:<40} {row['calls']:>8} {row['total_ms']:>12.2f} {row['mean_ms']:>10.3f} "
+                  f"{row['p95_ms']:>10.3f} {row['max_ms']:>10.3f}", file=sys.stderr)
+    elif target:
+        with open(target, 'w', encoding='utf-8') as file:
+            json.dump(stats, file, indent=2)
+
+
+# Worker-Prozesse des Exports erben die Variable, ausgegeben wird nur im Hauptprozess
+if PROFILE_TARGET and multiprocessing.parent_process() is None:
+    atexit.register(dump_timing_stats)
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def load_yaml(yaml_content):
+    return yaml.load(yaml_content, Loader=YAML_LOADER)
+
+
+def dump_yaml(data):
+    return yaml.dump(data, Dumper=YAML_DUMPER, sort_keys=False, allow_unicode=True)
+
+
+def write_file_atomic(file_path, text):
+    # Erst in eine temporäre Datei im selben Ordner schreiben, dann umbenennen
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(file_path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def extract_texture_paths(data):
+    # Sammelt die Frames in Reihenfolge sowie alle eindeutigen Texturen
+    animation_frames = []
+    unique_textures = set()
+
+    def extract(data_obj):
+        if isinstance(data_obj, dict):
+            if 'MaterialAnimConfigs' in data_obj:
+                for material in data_obj['MaterialAnimConfigs']:
+                    if isinstance(material, dict) and 'TexturePatternInfos' in material:
+                        for texture_info in material['TexturePatternInfos']:
+                            if isinstance(texture_info, dict) and \
+                            'CurveData' in texture_info and \
+                            texture_info['CurveData'] and \
+                            'KeyFrames' in texture_info['CurveData']:
+                                key_frames = texture_info['CurveData']['KeyFrames']
+                                frames_dict = {str(k): v for k, v in key_frames.items()}
+                                for value in frames_dict.values():
+                                    if isinstance(value, str):
+                                        animation_frames.append(value)
+                                        unique_textures.add(value)
+
+            for key, value in data_obj.items():
+                if isinstance(key, str) and 'texture' in key.lower() and isinstance(value, str):
+                    animation_frames.append(value)
+                    unique_textures.add(value)
+                elif isinstance(value, (dict, list)):
+                    extract(value)
+
+        elif isinstance(data_obj, list):
+            for item in data_obj:
+                if isinstance(item, str):
+                    animation_frames.append(item)
+                    unique_textures.add(item)
+                elif isinstance(item, (dict, list)):
+                    extract(item)
+
+    extract(data)
+    return list(unique_textures), animation_frames
+
+
+def keyframe_durations(data, frame_total):
+    # Länge jedes Frames in Animationsframes, aus den KeyFrame-Indizes und FrameCount.
+    # Ohne verwertbare Indizes zählt jeder Key als ein Frame.
+    durations = [1] * frame_total
+    curves = find_keyframe_curves(data)
+    if not curves or not frame_total:
+        return durations
+    try:
+        keys = [int(k) for k, v in curves[0]['KeyFrames'].items() if isinstance(v, str)]
+    except (TypeError, ValueError):
+        return durations
+    if len(keys) != frame_total or keys[0] < 0 or any(b <= a for a, b in zip(keys, keys[1:])):
+        return durations
+    frame_count = data.get('FrameCount') if isinstance(data, dict) else None
+    if not isinstance(frame_count, int) or isinstance(frame_count, bool) or frame_count <= keys[-1]:
+        frame_count = keys[-1] + 1
+    durations = [end - start for start, end in zip(keys, keys[1:] + [frame_count])]
+    # Vor dem ersten Key ist bereits dessen Textur zu sehen
+    durations[0] += keys[0]
+    return durations
+
+
+def frame_durations_ms(durations, fps):
+    # Gerundete Zeitstempel statt gerundeter Dauern, damit sich kein Fehler aufsummiert
+    stamps = [round(tick * 1000 / fps) for tick in accumulate(durations, initial=0)]
+    return [end - start for start, end in zip(stamps, stamps[1:])]
+
+
+def normalize_animation(data, animation_frames, file_path):
+    # Setzt FrameCount auf die Länge der Zeitleiste und (falls leer) den Namen, liefert True bei Änderungen
+    if not animation_frames or not isinstance(data, dict):
+        return False
+    frame_count = sum(keyframe_durations(data, len(animation_frames)))
+    changed = data.get('FrameCount') != frame_count
+    data['FrameCount'] = frame_count
+    if not data.get('Name') and file_path:
+        data['Name'] = os.path.splitext(os.path.basename(file_path))[0]
+        changed = True
+    return changed
+
+
+def find_keyframe_curves(data):
+    # Alle CurveData-Dicts mit KeyFrames, in die AnimationDocument die Frames schreibt
+    curves = []
+
+    def collect(data_obj):
+        if isinstance(data_obj, dict):
+            if 'MaterialAnimConfigs' in data_obj:
+                for material in data_obj['MaterialAnimConfigs']:
+                    if isinstance(material, dict) and 'TexturePatternInfos' in material:
+                        for texture_info in material['TexturePatternInfos']:
+                            if isinstance(texture_info, dict) and \
+                            'CurveData' in texture_info and \
+                            texture_info['CurveData'] and \
+                            'KeyFrames' in texture_info['CurveData']:
+                                curves.append(texture_info['CurveData'])
+
+            for value in data_obj.values():
+                if isinstance(value, (dict, list)):
+                    collect(value)
+
+        elif isinstance(data_obj, list):
+            for item in data_obj:
+                if isinstance(item, (dict, list)):
+                    collect(item)
+
+    collect(data)
+    # Dieselbe Kurve kann über verschachtelte Configs mehrfach gefunden werden
+    return list({id(curve): curve for curve in curves}.values())
+
+
+class PlaybackClock:
+    # Bildet die Zeit einer monotonen Uhr auf Frames ab. Gezählt wird in Animationsframes (Ticks),
+    # ein Frame mit Dauer n steht also n / fps Sekunden. Verspätete Abfragen überspringen Frames.
+    def __init__(self, durations=(), fps=30, loop=False, clock=time.perf_counter):
+        self.clock = clock
+        self.fps = fps
+        self.loop = loop
+        self.origin = None  # Uhrzeit von Tick 0, None solange angehalten
+        self.paused_tick = 0.0
+        self.set_durations(durations)
+
+    def set_durations(self, durations):
+        self.starts = list(accumulate(durations, initial=0))
+        self.total = self.starts[-1]
+
+    def tick(self, now=None):
+        if self.origin is None:
+            return self.paused_tick
+        return ((self.clock() if now is None else now) - self.origin) * self.fps
+
+    def start(self, tick=0.0, now=None):
+        now = self.clock() if now is None else now
+        self.origin = now - tick / self.fps
+
+    def pause(self, now=None):
+        self.paused_tick = self.tick(now)
+        self.origin = None
+
+    def set_fps(self, fps, now=None):
+        # Die aktuelle Position bleibt beim Tempowechsel erhalten
+        now = self.clock() if now is None else now
+        tick = self.tick(now)
+        self.fps = fps
+        if self.origin is not None:
+            self.start(tick, now)
+
+    def position(self, tick):
+        # (Durchlauf, Frame-Index) für einen Tick, None am Ende einer nicht geloopten Animation
+        if self.total <= 0:
+            return None
+        cycle, offset = divmod(max(tick, 0.0), self.total)
+        if cycle and not self.loop:
+            return None
+        return int(cycle), bisect_right(self.starts, offset) - 1
+
+    def seconds_until_next(self, tick):
+        # Zeit bis zum nächsten Framewechsel, für einen punktgenau gestellten Timer
+        if self.total <= 0:
+            return None
+        offset = tick % self.total
+        index = bisect_right(self.starts, offset) - 1
+        return (self.starts[index + 1] - offset) / self.fps
+
+
+class AnimationDocument:
+    # Geparstes YAML, das in-place bearbeitet wird; Änderungen landen im Undo-Log
+    def __init__(self, data, file_path=None):
+        self.data = data if data is not None else {}
+        self.file_path = file_path
+        self.lock = threading.RLock()
+        self.undo_stack = []
+        self.redo_stack = []
+        self.revision = 0
+        self.saved_revision = 0
+        self._reindex()
+        normalize_animation(self.data, self.frames, file_path)
+
+    def _reindex(self):
+        self.curves = find_keyframe_curves(self.data)
+        self.texture_paths, self.frames = extract_texture_paths(self.data)
+        self.durations = keyframe_durations(self.data, len(self.frames))
+
+    @property
+    def dirty(self):
+        return self.revision != self.saved_revision
+
+    def _write_frames(self):
+        # Nur die KeyFrames-Dicts werden neu aufgebaut, der Rest des Baums bleibt unberührt.
+        # Jeder Frame behält seine Dauer, die Keys ergeben sich aus den aufsummierten Dauern.
+        starts = list(accumulate(self.durations, initial=0))
+        for curve in self.curves:
+            curve['KeyFrames'] = {str(start): frame for start, frame in zip(starts, self.frames)}
+        if self.frames and isinstance(self.data, dict):
+            self.data['FrameCount'] = starts[-1]
+
+    def _apply(self, operation, reverse=False):
+        kind = operation[0]
+        if kind == 'move':
+            _, source_index, target_index = operation
+            if reverse:
+                source_index, target_index = target_index, source_index
+            self.frames.insert(target_index, self.frames.pop(source_index))
+            self.durations.insert(target_index, self.durations.pop(source_index))
+            self._write_frames()
+        elif kind in ('insert', 'remove'):
+            _, index, texture_path, duration = operation
+            if (kind == 'insert') != reverse:
+                self.frames.insert(index, texture_path)
+                self.durations.insert(index, duration)
+            else:
+                self.frames.pop(index)
+                self.durations.pop(index)
+            self._write_frames()
+        elif kind == 'set':
+            _, container, key, had_key, old_value, new_value = operation
+            if not reverse:
+                container[key] = new_value
+            elif had_key:
+                container[key] = old_value
+            else:
+                container.pop(key, None)
+            if container is self.data and key == 'FrameCount':
+                # FrameCount bestimmt, wie lange der letzte Frame stehen bleibt
+                self.durations = keyframe_durations(self.data, len(self.frames))
+        elif kind == 'replace':
+            _, old_data, new_data = operation
+            self.data = old_data if reverse else new_data
+            self._reindex()
+        elif kind == 'group':
+            # Mehrere Änderungen aus einer Eingabe, rückgängig in umgekehrter Reihenfolge
+            for part in (reversed(operation[1]) if reverse else operation[1]):
+                self._apply(part, reverse)
+
+    def _record(self, operation):
+        with self.lock:
+            self._apply(operation)
+            self.undo_stack.append(operation)
+            self.redo_stack.clear()
+            self.revision += 1
+
+    def move_frame(self, source_index, target_index):
+        if source_index != target_index:
+            self._record(('move', source_index, target_index))
+
+    def insert_frame(self, index, texture_path, duration=1):
+        self._record(('insert', index, texture_path, duration))
+
+    def remove_frame(self, index):
+        self._record(('remove', index, self.frames[index], self.durations[index]))
+
+    def set_value(self, container, key, value, merge=False):
+        # Gibt False zurück, wenn sich nichts ändert (kein Eintrag im Undo-Log); ein fehlender Key gilt als None.
+        # Mit merge landen aufeinanderfolgende Eingaben in dasselbe Feld (z.B. Tastendrücke) in einem Schritt.
+        return self.set_values([(container, key, value)], merge)
+
+    def set_values(self, changes, merge=False):
+        # Mehrere Felder als ein Undo-Schritt, changes ist eine Liste von (container, key, value)
+        with self.lock:
+            operations = [('set', container, key, key in container, container.get(key), value)
+                          for container, key, value in changes if container.get(key) != value]
+            if not operations:
+                return False
+            previous = self.undo_stack[-1] if self.undo_stack else None
+            if (merge and len(operations) == 1 and not self.redo_stack and previous is not None
+                    and previous[0] == 'set' and previous[1] is operations[0][1] and previous[2] == operations[0][2]):
+                self._apply(operations[0])
+                self.undo_stack[-1] = previous[:5] + (operations[0][5],)
+                self.revision += 1
+            else:
+                self._record(operations[0] if len(operations) == 1 else ('group', operations))
+            return True
+
+    def replace_data(self, data):
+        self._record(('replace', self.data, data if data is not None else {}))
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def next_undo(self):
+        # Der Schritt, den undo() anwenden würde; Ansichten können sich so vorher darauf einstellen
+        return self.undo_stack[-1] if self.undo_stack else None
+
+    def next_redo(self):
+        return self.redo_stack[-1] if self.redo_stack else None
+
+    def undo(self):
+        with self.lock:
+            if not self.undo_stack:
+                return None
+            operation = self.undo_stack.pop()
+            self._apply(operation, reverse=True)
+            self.redo_stack.append(operation)
+            self.revision += 1
+            return operation
+
+    def redo(self):
+        with self.lock:
+            if not self.redo_stack:
+                return None
+            operation = self.redo_stack.pop()
+            self._apply(operation)
+            self.undo_stack.append(operation)
+            self.revision += 1
+            return operation
+
+    def to_yaml(self):
+        with self.lock:
+            return dump_yaml(self.data)
+
+    def serialize(self):
+        # Text und Revision werden gemeinsam unter dem Lock erzeugt
+        with self.lock:
+            return dump_yaml(self.data), self.revision
+
+    def save(self, file_path=None):
+        text, revision = self.serialize()
+        write_file_atomic(file_path or self.file_path, text)
+        self.mark_saved(revision)
+        return text
+
+    def mark_saved(self, revision):
+        # Ein verspätet gemeldeter älterer Speicherstand darf nichts zurücksetzen
+        with self.lock:
+            self.saved_revision = max(self.saved_revision, revision)
+
+
+@timed()
+def load_animation_file(file_path, cache_dir=None):
+    # Liest die Datei genau einmal; mit cache_dir wird der geparste Baum nach (Pfad, mtime, Größe) gecacht
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, hashlib.sha1(file_path.encode('utf-8')).hexdigest() + '.pickle')
+        try:
+            with open(cache_path, 'rb') as file:
+                cached = pickle.load(file)
+            if cached['key'] == key:
+                return AnimationDocument(pickle.loads(cached['data']), file_path), cached['text']
+        except Exception:
+            pass
+
+    with open(file_path, 'r', encoding='utf-8') as file:
+        yaml_content = file.read()
+    data = load_yaml(yaml_content)
+    # Vor der Normalisierung sichern, damit der Cache den Dateiinhalt widerspiegelt
+    raw_data = pickle.dumps(data, pickle.HIGHEST_PROTOCOL) if cache_path else None
+
+    document = AnimationDocument(data, file_path)
+    if document.frames:
+        yaml_content = document.to_yaml()
+
+    if cache_path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_path + '.tmp', 'wb') as file:
+                pickle.dump({'key': key, 'data': raw_data, 'text': yaml_content}, file, pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_path + '.tmp', cache_path)
+        except OSError:
+            pass
+    return document, yaml_content
+
+
+def texture_directory(base_path):
+    # Ordner einer Textur in der Form, unter der TextureIndex und der Datei-Watcher ihn führen
+    return os.path.normcase(os.path.dirname(os.path.normpath(base_path)))
+
+
+def find_missing_textures(animation_frames, yaml_directory, texture_index=None):
+    resolve = texture_index.resolve if texture_index is not None else resolve_texture_file
+    missing = []
+    for texture_path in dict.fromkeys(animation_frames):
+        if resolve(os.path.join(yaml_directory, texture_path)) is None:
+            missing.append(texture_path)
+    return missing
+
+
+class TextureIndex:
+    # Verzeichnisinhalte per os.scandir, damit Texturen ohne stat-Aufrufe aufgelöst werden
+    def __init__(self):
+        self.directories = {}
+        self.lock = threading.Lock()
+
+    def scan(self, directory):
+        directory = os.path.normcase(os.path.normpath(directory))
+        entries = {}
+        try:
+            with os.scandir(directory) as iterator:
+                for entry in iterator:
+                    try:
+                        if entry.is_file():
+                            entries[os.path.normcase(entry.name)] = entry
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        with self.lock:
+            self.directories[directory] = entries
+        return entries
+
+    def scan_for(self, yaml_directory, texture_paths):
+        # Alle von der Animation referenzierten Ordner einmal einlesen, liefert die Ordner
+        directories = {texture_directory(os.path.join(yaml_directory, path)) for path in texture_paths}
+        for directory in directories:
+            if directory not in self.directories:
+                self.scan(directory)
+        return sorted(directories)
+
+    def invalidate(self, directory=None):
+        with self.lock:
+            if directory is None:
+                self.directories.clear()
+            else:
+                self.directories.pop(os.path.normcase(os.path.normpath(directory)), None)
+
+    def resolve(self, base_path):
+        # Gleiche Reihenfolge der Endungen wie resolve_texture_file, liefert (Pfad, mtime) oder None
+        directory, name = os.path.split(os.path.normcase(os.path.normpath(base_path)))
+        entries = self.directories.get(directory)
+        if entries is None:
+            entries = self.scan(directory)
+        for ext in TEXTURE_EXTENSIONS:
+            entry = entries.get(name + ext)
+            if entry is not None:
+                try:
+                    return entry.path, entry.stat().st_mtime_ns
+                except OSError:
+                    return None
+        return None
+
+    def missing_report(self, animation_frames, yaml_directory):
+        # Fehlende Texturen mit den Frame-Indizes, in denen sie verwendet werden
+        report = {}
+        for frame_index, texture_path in enumerate(animation_frames):
+            if texture_path in report or self.resolve(os.path.join(yaml_directory, texture_path)) is None:
+                report.setdefault(texture_path, []).append(frame_index)
+        return report
+
+
+def resolve_texture_file(base_path):
+    # Sucht die Texturdatei mit einer der bekannten Endungen, liefert (Pfad, mtime) oder None
+    for ext in TEXTURE_EXTENSIONS:
+        test_path = os.path.normpath(base_path + ext)
+        try:
+            stat = os.stat(test_path)
+        except OSError:
+            continue
+        return test_path, stat.st_mtime_ns
+    return None
+
+
+def load_frame(path, canvas_size=None):
+    # Lädt einen Frame als RGBA und zentriert ihn bei abweichender Größe auf der Leinwand
+    with Image.open(path) as img:
+        frame = img.convert('RGBA')
+    if canvas_size is not None and frame.size != canvas_size:
+        canvas = Image.new('RGBA', canvas_size, (0, 0, 0, 0))
+        canvas.paste(frame, ((canvas_size[0] - frame.width) // 2, (canvas_size[1] - frame.height) // 2))
+        frame = canvas
+    return frame
+
+
+def build_global_palette(paths, samples=GLOBAL_PALETTE_SAMPLES):
+    # Gemeinsame 255-Farben-Palette aus gleichmäßig verteilten Stichproben-Frames
+    step = max(1, len(paths) // samples)
+    picked = paths[::step][:samples]
+    thumb_size = 128
+    montage = Image.new('RGB', (thumb_size * len(picked), thumb_size))
+    for i, path in enumerate(picked):
+        frame = load_frame(path).convert('RGB')
+        frame.thumbnail((thumb_size, thumb_size))
+        montage.paste(frame, (i * thumb_size, 0))
+    palette = montage.quantize(colors=GIF_TRANSPARENT_INDEX).getpalette()[:GIF_TRANSPARENT_INDEX * 3]
+    # Auffüllen mit der ersten Farbe, damit der transparente Index nie gewählt wird
+    while len(palette) < 256 * 3:
+        palette += palette[:3]
+    return palette
+
+
+def _encode_gif_frame(frame, palette):
+    alpha = frame.getchannel('A')
+    rgb = frame.convert('RGB')
+    if palette is not None:
+        palette_image = Image.new('P', (1, 1))
+        palette_image.putpalette(palette)
+        indexed = rgb.quantize(palette=palette_image)
+    else:
+        indexed = rgb.quantize(colors=GIF_TRANSPARENT_INDEX)
+        frame_palette = indexed.getpalette()[:GIF_TRANSPARENT_INDEX * 3]
+        indexed.putpalette(frame_palette + [0] * (256 * 3 - len(frame_palette)))
+
+    if alpha.getextrema()[0] < 128:
+        mask = alpha.point(lambda a: 255 if a < 128 else 0)
+        indexed.paste(GIF_TRANSPARENT_INDEX, mask=mask)
+
+    # Bildbeschreibung + LZW-Daten, die Graphic Control Extension schreibt der Writer
+    data = GifImagePlugin.getdata(indexed, include_color_table=palette is None)
+    return b''.join(data)
+
+
+def _iter_png_chunks(data):
+    pos = 8
+    while pos < len(data):
+        length, chunk_type = struct.unpack('>I4s', data[pos:pos + 8])
+        yield chunk_type, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+
+def _encode_png_frame(frame):
+    buffer = io.BytesIO()
+    frame.save(buffer, 'PNG')
+    header = None
+    idat = []
+    for chunk_type, chunk_data in _iter_png_chunks(buffer.getvalue()):
+        if chunk_type == b'IHDR':
+            header = chunk_data
+        elif chunk_type == b'IDAT':
+            idat.append(chunk_data)
+    return header, b''.join(idat)
+
+
+def _iter_riff_chunks(data):
+    pos = 12
+    while pos < len(data):
+        chunk_type, length = struct.unpack('<4sI', data[pos:pos + 8])
+        yield chunk_type, data[pos:pos + 8 + length + (length & 1)]
+        pos += 8 + length + (length & 1)
+
+
+def _encode_webp_frame(frame):
+    buffer = io.BytesIO()
+    frame.save(buffer, 'WEBP', lossless=True)
+    # Nur die Bitstream-Chunks (ALPH/VP8/VP8L) landen im ANMF-Chunk
+    return b''.join(chunk for chunk_type, chunk in _iter_riff_chunks(buffer.getvalue())
+                    if chunk_type in (b'ALPH', b'VP8 ', b'VP8L'))
+
+
+def encode_frame(path, canvas_size, export_format, palette=None):
+    # Läuft in den Worker-Prozessen: Dekodieren, Quantisieren bzw. Komprimieren
+    frame = load_frame(path, canvas_size)
+    digest = hashlib.blake2b(frame.tobytes(), digest_size=16).digest()
+    if export_format == 'gif':
+        payload = _encode_gif_frame(frame, palette)
+    elif export_format == 'apng':
+        payload = _encode_png_frame(frame)
+    elif export_format == 'webp':
+        payload = _encode_webp_frame(frame)
+    else:
+        payload = frame.tobytes()
+    return digest, payload
+
+
+def iter_encoded_frames(paths, canvas_size, export_format, palette=None, workers=None):
+    # Liefert die kodierten Frames in Reihenfolge, höchstens 2 * workers gleichzeitig im Speicher
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(paths) < PARALLEL_MIN_FRAMES:
+        for path in paths:
+            yield encode_frame(path, canvas_size, export_format, palette)
+        return
+
+    context = multiprocessing.get_context('spawn')
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    try:
+        pending = deque()
+        remaining = iter(paths)
+        for path in remaining:
+            pending.append(pool.submit(encode_frame, path, canvas_size, export_format, palette))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            result = pending.popleft().result()
+            path = next(remaining, None)
+            if path is not None:
+                pending.append(pool.submit(encode_frame, path, canvas_size, export_format, palette))
+            yield result
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def fold_identical_frames(encoded_frames, frame_durations, fold=True):
+    # Fasst aufeinanderfolgende identische Frames zu einem längeren Frame zusammen
+    previous = None
+    duration = 0
+    for (digest, payload), frame_duration in zip(encoded_frames, frame_durations):
+        if fold and previous is not None and digest == previous[0]:
+            duration += frame_duration
+            continue
+        if previous is not None:
+            yield previous[0], previous[1], duration
+        previous = (digest, payload)
+        duration = frame_duration
+    if previous is not None:
+        yield previous[0], previous[1], duration
+
+
+class GifWriter:
+    def __init__(self, fp, canvas_size, loop, palette=None):
+        self.fp = fp
+        self.elapsed = 0
+        flags = 0
+        if palette is not None:
+            flags = 0x80 | 0x07  # globale Farbtabelle mit 256 Einträgen
+        # Hintergrund ist der transparente Index, damit Disposal 2 auf Transparenz zurücksetzt
+        fp.write(b'GIF89a' + struct.pack('<HHBBB', canvas_size[0], canvas_size[1], flags, GIF_TRANSPARENT_INDEX, 0))
+        if palette is not None:
+            fp.write(bytes(palette))
+        if loop:
+            fp.write(b'!\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', 0) + b'\x00')
+
+    def add_frame(self, payload, duration):
+        # Gerundete Zeitstempel statt gerundeter Dauern, damit sich kein Fehler aufsummiert
+        delay = round((self.elapsed + duration) / 10) - round(self.elapsed / 10)
+        self.elapsed += duration
+        # Disposal: auf Hintergrund zurücksetzen. Transparenz gilt für jeden Frame, sonst zeigen Decoder nach
+        # einem deckenden Frame Farbe 0 statt Transparenz; deckende Pixel verwenden den Index nie.
+        packed = (2 << 2) | 1
+        self.fp.write(b'!\xf9\x04' + struct.pack('<BHB', packed, delay, GIF_TRANSPARENT_INDEX) + b'\x00')
+        self.fp.write(payload)
+
+    def close(self):
+        self.fp.write(b';')
+
+
+class ApngWriter:
+    def __init__(self, fp, canvas_size, loop):
+        self.fp = fp
+        self.canvas_size = canvas_size
+        self.loop = loop
+        self.sequence = 0
+        self.frame_count = 0
+        self.actl_offset = None
+
+    def write_chunk(self, chunk_type, data):
+        self.fp.write(struct.pack('>I', len(data)) + chunk_type + data)
+        self.fp.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    def add_frame(self, payload, duration):
+        header, data = payload
+        if self.frame_count == 0:
+            self.fp.write(b'\x89PNG\r\n\x1a\n')
+            self.write_chunk(b'IHDR', header)
+            # Platzhalter, die echte Frameanzahl steht erst am Ende fest
+            self.actl_offset = self.fp.tell()
+            self.write_chunk(b'acTL', struct.pack('>II', 0, 0))
+
+        delay_num, delay_den = duration, 1000
+        if delay_num > 0xffff:
+            delay_num, delay_den = min(0xffff, round(duration / 10)), 100
+        self.write_chunk(b'fcTL', struct.pack(
+            '>IIIIIHHBB', self.sequence, self.canvas_size[0], self.canvas_size[1],
+            0, 0, delay_num, delay_den, 0, 0))
+        self.sequence += 1
+
+        if self.frame_count == 0:
+            self.write_chunk(b'IDAT', data)
+        else:
+            self.write_chunk(b'fdAT', struct.pack('>I', self.sequence) + data)
+            self.sequence += 1
+        self.frame_count += 1
+
+    def close(self):
+        self.write_chunk(b'IEND', b'')
+        end = self.fp.tell()
+        self.fp.seek(self.actl_offset)
+        self.write_chunk(b'acTL', struct.pack('>II', self.frame_count, 0 if self.loop else 1))
+        self.fp.seek(end)
+
+
+class WebpWriter:
+    def __init__(self, fp, canvas_size, loop):
+        self.fp = fp
+        self.canvas_size = canvas_size
+        width, height = canvas_size
+        fp.write(b'RIFF\x00\x00\x00\x00WEBP')
+        vp8x = struct.pack('<I', 0x10 | 0x02) + (width - 1).to_bytes(3, 'little') + (height - 1).to_bytes(3, 'little')
+        self.write_chunk(b'VP8X', vp8x)
+        self.write_chunk(b'ANIM', struct.pack('<IH', 0, 0 if loop else 1))
+
+    def write_chunk(self, chunk_type, data):
+        self.fp.write(chunk_type + struct.pack('<I', len(data)) + data)
+        if len(data) & 1:
+            self.fp.write(b'\x00')
+
+    def add_frame(self, payload, duration):
+        width, height = self.canvas_size
+        header = (b'\x00' * 6 + (width - 1).to_bytes(3, 'little') + (height - 1).to_bytes(3, 'little')
+                  + min(duration, 0xffffff).to_bytes(3, 'little') + b'\x02')  # ohne Überblenden
+        self.write_chunk(b'ANMF', header + payload)
+
+    def close(self):
+        size = self.fp.tell()
+        self.fp.seek(4)
+        self.fp.write(struct.pack('<I', size - 8))
+        self.fp.seek(size)
+
+
+class SpriteSheetWriter:
+    # Packt jedes eindeutige Frame einmal in ein Raster, dazu eine JSON-Beschreibung.
+    # Das Raster entsteht erst in close(), seine Größe richtet sich nach den eindeutigen Frames.
+    def __init__(self, fp, canvas_size, file_path):
+        self.fp = fp
+        self.canvas_size = canvas_size
+        self.file_path = file_path
+        self.cells = {}  # Digest -> Zellenindex
+        self.payloads = []  # RGBA-Daten pro Zelle
+        self.frames = []  # (Zellenindex, Dauer)
+
+    def add_frame(self, payload, duration, digest):
+        index = self.cells.get(digest)
+        if index is None:
+            index = self.cells[digest] = len(self.payloads)
+            self.payloads.append(payload)
+        self.frames.append((index, duration))
+
+    def close(self):
+        width, height = self.canvas_size
+        columns = max(1, math.ceil(math.sqrt(len(self.payloads))))
+        rows = max(1, math.ceil(len(self.payloads) / columns))
+        sheet = Image.new('RGBA', (width * columns, height * rows), (0, 0, 0, 0))
+        positions = []
+        for index, payload in enumerate(self.payloads):
+            x, y = (index % columns) * width, (index // columns) * height
+            sheet.paste(Image.frombytes('RGBA', self.canvas_size, payload), (x, y))
+            positions.append({'x': x, 'y': y, 'w': width, 'h': height})
+        self.payloads.clear()
+        sheet.save(self.fp, 'PNG')
+        frames = [dict(positions[index], duration=duration) for index, duration in self.frames]
+        with open(os.path.splitext(self.file_path)[0] + '.json', 'w', encoding='utf-8') as file:
+            json.dump({'image': os.path.basename(self.file_path), 'frames': frames}, file, indent=2)
+
+
+@timed()
+def export_animation(texture_files, file_path, export_format='gif', frame_duration=33, loop=True,
+                     global_palette=False, fold_duplicates=True, workers=None,
+                     progress=None, is_cancelled=None):
+    # Streamt die Frames in den Encoder, progress(done, total) meldet den Fortschritt.
+    # frame_duration ist eine feste Dauer in ms oder eine Liste mit einer Dauer pro Frame.
+    if not texture_files:
+        raise ValueError("No valid frames found")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    if isinstance(frame_duration, int):
+        frame_durations = repeat(frame_duration)
+    else:
+        frame_durations = list(frame_duration)
+        if len(frame_durations) != len(texture_files):
+            raise ValueError("Expected one duration per frame")
+
+    with Image.open(texture_files[0]) as first:
+        canvas_size = first.size
+    palette = None
+    if export_format == 'gif' and global_palette:
+        palette = build_global_palette(texture_files)
+
+    total = len(texture_files)
+    try:
+        with open(file_path, 'wb') as fp:
+            if export_format == 'gif':
+                writer = GifWriter(fp, canvas_size, loop, palette)
+            elif export_format == 'apng':
+                writer = ApngWriter(fp, canvas_size, loop)
+            elif export_format == 'webp':
+                writer = WebpWriter(fp, canvas_size, loop)
+            else:
+                writer = SpriteSheetWriter(fp, canvas_size, file_path)
+
+            def counted(frames):
+                for done, frame in enumerate(frames, 1):
+                    if is_cancelled and is_cancelled():
+                        raise ExportCancelled()
+                    if progress:
+                        progress(done, total)
+                    yield frame
+
+            source = iter_encoded_frames(texture_files, canvas_size, export_format, palette, workers)
+            try:
+                for digest, payload, duration in fold_identical_frames(counted(source), frame_durations,
+                                                                        fold_duplicates):
+                    if export_format == 'spritesheet':
+                        writer.add_frame(payload, duration, digest)
+                    else:
+                        writer.add_frame(payload, duration)
+            finally:
+                source.close()
+            writer.close()
+    except BaseException:
+        # Keine halb geschriebenen Dateien zurücklassen
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise